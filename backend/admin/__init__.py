@@ -0,0 +1,2 @@
+from .logs import *
+from .profiling import *
@@ -0,0 +1,16 @@
+from typing import Annotated, Literal
+from fastapi import APIRouter, Depends
+from sqlalchemy import select
+import auth
+from db import db, Logs
+from serialize import stream_export
+
+admin_router = APIRouter()
+
+
+@admin_router.get("/admin/logs/export")
+async def export_logs(_: Annotated[auth.UserSchema, Depends(auth.get_current_admin_user)], format: Literal["jsonl", "csv"] = "jsonl", user_id: int | None = None):
+    query = select(Logs.id, Logs.user_id, Logs.file_id, Logs.action, Logs.timestamp).order_by(Logs.id)
+    if user_id is not None:
+        query = query.where(Logs.user_id == user_id)
+    return stream_export(db.query_stream(query), format, "logs")
@@ -0,0 +1,15 @@
+from typing import Annotated
+from fastapi import Depends
+import auth
+import profiling
+from .logs import admin_router
+
+
+@admin_router.get("/admin/slow")
+async def slow_report(_: Annotated[auth.UserSchema, Depends(auth.get_current_admin_user)], limit: int = 20):
+    """Slowest recent requests and statements seen by the worker serving this request."""
+    by_duration = lambda entry: entry["duration_ms"]
+    return {
+        "requests": sorted(profiling.slow_requests, key=by_duration, reverse=True)[:limit],
+        "queries": sorted(profiling.slow_queries, key=by_duration, reverse=True)[:limit],
+    }
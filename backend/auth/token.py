@@ -74,6 +74,15 @@ async def get_current_active_user(
     return current_user
 
 
+async def get_current_admin_user(
+    current_user: Annotated[UserSchema, Security(get_current_user)],
+):
+    with db.query_first(User, id=current_user.id) as user:
+        if not user or not user.is_admin:
+            raise HTTPException(status_code=403, detail="Admin privileges required")
+    return current_user
+
+
 @router.post("/token")
 async def get_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
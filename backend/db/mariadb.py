@@ -56,6 +56,9 @@ class MariaDB:
             "?charset=utf8mb4"
         )
 
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+
         self.engine = create_engine(
             self.connection_string,
             pool_size=pool_size,
@@ -217,6 +220,27 @@ class MariaDB:
         with self.get_session() as session:
             yield session.query(model).filter_by(**filters).first()
 
+    def query_stream(
+        self, statement: Executable, batch_size: int = 1000
+    ) -> Generator[Dict[str, Any], None, None]:
+        """
+        Stream rows of a select statement through a server-side cursor.
+
+        The session stays open until the generator is exhausted or closed,
+        so only one batch of rows is held in memory at a time.
+
+        Args:
+            statement: SQLAlchemy select statement
+            batch_size: Number of rows fetched from the cursor per round-trip
+
+        Yields:
+            Each row as a dict keyed by column label
+        """
+        with self.get_session() as session:
+            result = session.execute(statement.execution_options(yield_per=batch_size))
+            for row in result:
+                yield row._asdict()
+
     @contextmanager
     def transaction(self) -> Generator[Session, None, None]:
         """
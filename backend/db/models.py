@@ -1,17 +1,24 @@
 from . import mariadb as db
+from datetime import datetime, timezone
 from pydantic import BaseModel
 
 
+def utcnow() -> datetime:
+    """Naive UTC timestamp, matching how DateTime columns are stored."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 class User(db.Base):
     __tablename__ = "users"
 
     id = db.Column(db.Integer, primary_key=True, index=True, autoincrement=True)
-    username = db.Column(db.String(50), nullable=False)
+    username = db.Column(db.String(50), index=True, nullable=False)
     email = db.Column(db.String(100), unique=True, index=True, nullable=False)
     password = db.Column(db.String(100), nullable=False)
-    used = db.Column(db.Integer, default=0, nullable=False)  # in B
-    quota = db.Column(db.Integer, default=10240, nullable=False)  # in B
+    used = db.Column(db.BigInteger, default=0, nullable=False)  # in B
+    quota = db.Column(db.BigInteger, default=10240, nullable=False)  # in B
     is_active = db.Column(db.Boolean, default=True, nullable=False)
+    is_admin = db.Column(db.Boolean, default=False, nullable=False)
 
 
     def __repr__(self):
@@ -32,9 +39,18 @@ class Files(db.Base):
 
     id = db.Column(db.Integer, primary_key=True, index=True)
     filename = db.Column(db.String(255), nullable=False)
-    size = db.Column(db.Integer, nullable=False)  # in bytes
+    size = db.Column(db.BigInteger, nullable=False)  # logical size in bytes
+    stored_size = db.Column(db.BigInteger, nullable=False)  # bytes stored in S3, after compression
+    compression = db.Column(db.String(16), nullable=True)  # e.g. "zstd", None if stored as-is
     owner_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
-    original = db.Column(db.Integer, nullable=False)  # refers to original user id if shared
+    tier = db.Column(db.String(32), default="hot", nullable=False)  # "hot", an S3 storage class, or "archive"
+    access_count = db.Column(db.Integer, default=0, nullable=False)
+    last_accessed = db.Column(db.DateTime, default=utcnow, index=True, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_files_owner_filename", "owner_id", "filename"),  # prefix search
+        db.Index("ix_files_filename_fulltext", "filename", mysql_prefix="FULLTEXT"),
+    )
 
     def __repr__(self):
         return (
@@ -42,6 +58,19 @@ class Files(db.Base):
         )
 
 
+class Share(db.Base):
+    __tablename__ = "shares"
+
+    file_id = db.Column(db.Integer, db.ForeignKey("files.id", ondelete="CASCADE"), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)  # grantee
+    created_at = db.Column(db.DateTime, default=utcnow, nullable=False)
+
+    __table_args__ = (db.Index("ix_shares_user_file", "user_id", "file_id"),)  # files shared with a user
+
+    def __repr__(self):
+        return f"<Share(file_id={self.file_id}, user_id={self.user_id})>"
+
+
 class FileSchema(BaseModel):
     id: int
     filename: str
@@ -53,6 +82,13 @@ class FileSchema(BaseModel):
         from_attributes = True
 
 
+class FileListItem(BaseModel):
+    id: int
+    filename: str
+    original: int  # owner's user id
+    owner_username: str
+
+
 class Logs(db.Base):
     __tablename__ = "logs"
 
@@ -1,4 +1,5 @@
 import redis
+import redis.asyncio
 from .connection import Connection
 
 
@@ -6,10 +7,17 @@ class Redis:
     def __init__(self, con: Connection, db=0):
         self.host = con.host
         self.port = con.port
+        self.db = db
         self.client = redis.StrictRedis(
             host=con.host, port=con.port, decode_responses=True, db=db
         )
 
+    def async_client(self, **kwargs):
+        """A redis.asyncio client on the same server, for callers running on the event loop."""
+        return redis.asyncio.StrictRedis(
+            host=self.host, port=self.port, decode_responses=True, db=self.db, **kwargs
+        )
+
     def __repr__(self):
         return f"Redis(host={self.host}, port={self.port})"
 
@@ -28,15 +36,30 @@ class Redis:
     def setex(self, key, value, ex):
         self.client.setex(key, ex, value)
 
+    def setnx(self, key, value, ex):
+        return bool(self.client.set(key, value, nx=True, ex=ex))
+
     def get(self, key):
         return self.client.get(key)
 
     def hget(self, name, key):
         return self.client.hget(name, key)
 
+    def hgetall(self, name):
+        return self.client.hgetall(name)
+
+    def exists(self, key):
+        return bool(self.client.exists(key))
+
     def delete(self, key):
         self.client.delete(key)
 
+    def pipeline(self, transaction=True):
+        return self.client.pipeline(transaction=transaction)
+
+    def register_script(self, script):
+        return self.client.register_script(script)
+
     def subscribe(self, channel):
         pubsub = self.client.pubsub()
         pubsub.subscribe(channel)
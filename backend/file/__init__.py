@@ -1,2 +1,3 @@
 from .upload import *
 from .get import *
+from .resumable import *
@@ -1,25 +1,119 @@
-from typing import Annotated
-from fastapi import APIRouter, Depends
+import os
+from typing import Annotated, Literal
+from fastapi import APIRouter, BackgroundTasks, Depends
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy import exists, func, insert, or_, select, union_all
+from sqlalchemy.dialects.mysql import match
+from starlette.concurrency import run_in_threadpool
 import auth
-from db import db, User, Files
+import storage
+from db import db, User, Files, Share, FileListItem
+from serialize import ORJSONResponse, content_disposition, stream_export, stream_json_array
 import boto3
 
 file_router = APIRouter()
 
+LIST_STREAM_THRESHOLD = int(os.getenv("LIST_STREAM_THRESHOLD", 5000))
+SEARCH_MAX_LIMIT = 100
+FULLTEXT_OPERATORS = str.maketrans('+-<>()~*"@', " " * 10)  # the parser splits words on these too
+
 s3 = boto3.client('s3')
 
 
-@file_router.get("/list_files")
+def accessible_file_ids(user_id: int, *criteria, order_by=(), limit: int | None = None):
+    """
+    Ids of files a user owns or has been granted, as a UNION ALL of two index scans.
+
+    Extra criteria on Files are pushed into both branches so filters such as a
+    filename prefix use the (owner_id, filename) index on the owned side. With a
+    `limit`, each branch is sorted by `order_by` and cut to that many rows itself,
+    so a page reads a bounded range of the index instead of every match.
+    """
+    owned = select(Files.id).where(Files.owner_id == user_id, *criteria)
+    shared = select(Share.file_id.label("id")).where(Share.user_id == user_id)
+    if criteria or limit is not None:
+        shared = shared.join(Files, Files.id == Share.file_id).where(*criteria)
+    if limit is not None:
+        owned = owned.order_by(*order_by).limit(limit)
+        shared = shared.order_by(*order_by).limit(limit)
+    return union_all(owned, shared).subquery()
+
+
+def file_list_query(user_id: int, *criteria, order_by=(Files.id,), limit: int | None = None):
+    """
+    Select the listing columns for a user's owned and shared files, resolving owner names in one join.
+
+    `limit` bounds each branch of the union (see accessible_file_ids); pass offset + page size + 1.
+    """
+    ids = accessible_file_ids(user_id, *criteria, order_by=order_by, limit=limit)
+    return (
+        select(Files.id, Files.filename, Files.owner_id.label("original"), User.username.label("owner_username"))
+        .select_from(ids)
+        .join(Files, Files.id == ids.c.id)
+        .join(User, User.id == Files.owner_id)
+        .order_by(*order_by)
+    )
+
+
+def accessible_file(session, file_id: int, user_id: int):
+    """The file if the user owns it or it has been shared with them, else None."""
+    granted = exists().where(Share.file_id == file_id, Share.user_id == user_id)
+    return session.query(Files).filter(Files.id == file_id, or_(Files.owner_id == user_id, granted)).first()
+
+
+@file_router.get("/list_files", responses={200: {"model": list[FileListItem]}})
 async def lists_files(current_user: Annotated[auth.UserSchema, Depends(auth.get_current_user)]):
     with db.transaction() as session:
         cuser = session.query(User).get(current_user.id)
         if not cuser:
             return {"error": "User not found"}, 404
-        files = session.query(Files).filter_by(owner_id=current_user.id).all()
-        file_list = [{"id": f.id, "filename": f.filename, "original": f.original,
-                      "owner_username": session.query(User).get(f.original).username if f.original != cuser.id else current_user.username,
-                      } for f in files]
-    return file_list
+        total = session.execute(select(func.count()).select_from(accessible_file_ids(current_user.id))).scalar()
+        if total <= LIST_STREAM_THRESHOLD:
+            rows = session.execute(file_list_query(current_user.id))
+            return ORJSONResponse([row._asdict() for row in rows])
+    return stream_json_array(db.query_stream(file_list_query(current_user.id)))
+
+def fulltext_terms(q: str) -> str:
+    """Boolean-mode query requiring every word of `q`, each as a prefix; empty if there are none."""
+    return " ".join(f"+{t}*" for t in q.translate(FULLTEXT_OPERATORS).split())
+
+
+def escape_like(value: str) -> str:
+    """Escape LIKE wildcards using "/" as the escape character."""
+    return value.replace("/", "//").replace("%", "/%").replace("_", "/_")
+
+
+@file_router.get("/files/search")
+async def search_files(q: str, current_user: Annotated[auth.UserSchema, Depends(auth.get_current_user)],
+                       mode: Literal["prefix", "fulltext"] = "prefix", limit: int = 50, offset: int = 0):
+    """
+    Search the caller's owned and shared files by filename.
+
+    `prefix` matches the start of the name using the (owner_id, filename) index;
+    `fulltext` matches whole words (or word prefixes) anywhere in the name via the FULLTEXT index.
+    """
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    offset = max(0, offset)
+    window = offset + limit + 1
+    if mode == "prefix":
+        prefix = Files.filename.like(escape_like(q) + "%", escape="/")
+        query = file_list_query(current_user.id, prefix, order_by=(Files.filename, Files.id), limit=window)
+    else:
+        terms = fulltext_terms(q)
+        if not terms:
+            return ORJSONResponse({"items": [], "next_offset": None})
+        relevance = match(Files.filename, against=terms).in_boolean_mode()
+        query = file_list_query(current_user.id, relevance, order_by=(relevance.desc(), Files.id), limit=window)
+    with db.transaction() as session:
+        rows = session.execute(query.limit(limit + 1).offset(offset)).all()
+    items = [row._asdict() for row in rows[:limit]]
+    return ORJSONResponse({"items": items, "next_offset": offset + limit if len(rows) > limit else None})
+
+@file_router.get("/files/export")
+async def export_files(current_user: Annotated[auth.UserSchema, Depends(auth.get_current_user)], format: Literal["jsonl", "csv"] = "jsonl"):
+    query = file_list_query(current_user.id).add_columns(Files.size)
+    return stream_export(db.query_stream(query), format, f"{current_user.username}-files")
 
 @file_router.get("/file/{file_id}")
 async def get_file(file_id: int, current_user: Annotated[auth.UserSchema, Depends(auth.get_current_user)]):
@@ -27,29 +121,61 @@ async def get_file(file_id: int, current_user: Annotated[auth.UserSchema, Depend
         cuser = session.query(User).get(current_user.id)
         if not cuser:
             return {"error": "User not found"}
-        file = session.query(Files).filter_by(id=file_id, owner_id=current_user.id).first()
+        file = accessible_file(session, file_id, current_user.id)
         if not file:
             return {"error": "File not found"}, 404
-    return {"id": file.id, "filename": file.filename, "size": file.size}
+        return {"id": file.id, "filename": file.filename, "size": file.size, "stored_size": file.stored_size}
+
+async def ensure_hot(background_tasks: BackgroundTasks, file_id: int, owner_id: int, filename: str, tier: str) -> bool:
+    """
+    Restore archived objects before serving them; promote storage-class tiers in the background.
+
+    Returns False if the object is missing from storage.
+    """
+    if tier == storage.ARCHIVE_TIER:
+        await run_in_threadpool(storage.restore_object, s3, file_id, owner_id, filename, tier)
+    elif tier != storage.HOT_TIER:
+        background_tasks.add_task(storage.restore_object, s3, file_id, owner_id, filename, tier)
+    return await run_in_threadpool(storage.recover_hot_object, s3, file_id, owner_id, filename)
 
 @file_router.get("/file/{file_id}/download")
-async def download_file(file_id: int, current_user: Annotated[auth.UserSchema, Depends(auth.get_current_user)]):
+async def download_file(file_id: int, background_tasks: BackgroundTasks, current_user: Annotated[auth.UserSchema, Depends(auth.get_current_user)]):
     with db.transaction() as session:
         cuser = session.query(User).get(current_user.id)
         if not cuser:
             return {"error": "User not found"}
-        file = session.query(Files).filter_by(id=file_id, owner_id=current_user.id).first()
+        file = accessible_file(session, file_id, current_user.id)
         if not file:
             return {"error": "File not found"}, 404
-    try:
-        s3.head_object(Bucket="mshare", Key=file.original+"/"+file.filename)
-    except s3.exceptions.NoSuchKey:
+        owner_id, filename, tier, compression = file.owner_id, file.filename, file.tier, file.compression
+    if not await ensure_hot(background_tasks, file_id, owner_id, filename, tier):
         return {"error": "File not found in storage"}, 404
+    key = storage.object_key(owner_id, filename)
+    storage.record_access(file_id)
     presigned_url = s3.generate_presigned_url('get_object',
-                                              Params={'Bucket': 'mshare',
-                                                      'Key': file.original+"/"+file.filename},
+                                              Params={'Bucket': storage.BUCKET,
+                                                      'Key': key},
                                               ExpiresIn=3600)
-    return {"download_url": presigned_url, "error": None, "filename": file.filename}
+    # Compressed objects are served with Content-Encoding: zstd; clients without zstd support use /content
+    return {"download_url": presigned_url, "error": None, "filename": filename, "compression": compression}
+
+@file_router.get("/file/{file_id}/content")
+async def stream_file_content(file_id: int, background_tasks: BackgroundTasks, current_user: Annotated[auth.UserSchema, Depends(auth.get_current_user)]):
+    with db.transaction() as session:
+        file = accessible_file(session, file_id, current_user.id)
+        if not file:
+            return {"error": "File not found"}, 404
+        owner_id, filename, tier, compression = file.owner_id, file.filename, file.tier, file.compression
+    if not await ensure_hot(background_tasks, file_id, owner_id, filename, tier):
+        return {"error": "File not found in storage"}, 404
+    try:
+        obj = s3.get_object(Bucket=storage.BUCKET, Key=storage.object_key(owner_id, filename))
+    except s3.exceptions.NoSuchKey:
+        return {"error": "File not found in storage"}, 404
+    storage.record_access(file_id)
+    return StreamingResponse(storage.decompressed_chunks(obj["Body"], compression),
+                             media_type="application/octet-stream",
+                             headers={"Content-Disposition": content_disposition(filename)})
 
 @file_router.delete("/file/{file_id}")
 async def delete_file(file_id: int, current_user: Annotated[auth.UserSchema, Depends(auth.get_current_user)], do_s3:bool=False):
@@ -60,41 +186,85 @@ async def delete_file(file_id: int, current_user: Annotated[auth.UserSchema, Dep
         file = session.query(Files).filter_by(id=file_id, owner_id=current_user.id).first()
         if not file:
             return {"error": "File not found"}, 404
-        cuser.used -= file.size
-        session.delete(file)
-        refs = session.query(Files).filter_by(original=current_user.id, filename=file.filename).all()
-        for ref in refs:
-            session.delete(ref)
+        cuser.used -= file.stored_size
+        session.delete(file)  # shares are removed by ON DELETE CASCADE
+        owner_id, filename, tier = file.owner_id, file.filename, file.tier
     if do_s3:
-        s3.delete_object(Bucket="mshare", Key=cuser.id+"/"+file.filename)
+        s3.delete_object(Bucket=storage.BUCKET, Key=storage.stored_key(owner_id, filename, tier))
     return {"status": "File deleted"}
 
 @file_router.put("/file/{file_id}/rename")
 async def rename_file(file_id: int, new_name: str, current_user: Annotated[auth.UserSchema, Depends(auth.get_current_user)]):
-    with db.transaction() as session:
-        cuser = session.query(User).get(current_user.id)
-        if not cuser:
-            return {"error": "User not found"}
-        file = session.query(Files).filter_by(id=file_id, owner_id=current_user.id).first()
-        if not file:
-            return {"error": "File not found"}, 404
-        file = session.query(Files).filter_by(id=file_id, owner_id=current_user.id).update({"filename": new_name})
-        session.add(file)
+    moved = False
+    try:
+        with db.transaction() as session:
+            cuser = session.query(User).get(current_user.id)
+            if not cuser:
+                return {"error": "User not found"}
+            file = session.query(Files).filter_by(id=file_id, owner_id=current_user.id).first()
+            if not file:
+                return {"error": "File not found"}, 404
+            if file.filename == new_name:
+                return {"status": "File renamed", "new_name": new_name}
+            if session.query(exists().where(Files.owner_id == current_user.id, Files.filename == new_name)).scalar():
+                return {"error": "A file with that name already exists"}, 409
+            # Objects are keyed by filename, so the object moves with the rename
+            old_name, tier = file.filename, file.tier
+            moved = await run_in_threadpool(storage.copy_renamed_object, s3, current_user.id, old_name, new_name, tier)
+            file.filename = new_name
+    except Exception:
+        if moved:
+            s3.delete_object(Bucket=storage.BUCKET, Key=storage.stored_key(current_user.id, new_name, tier))
+        raise
+    if moved:
+        s3.delete_object(Bucket=storage.BUCKET, Key=storage.stored_key(current_user.id, old_name, tier))
     return {"status": "File renamed", "new_name": new_name}
 
+class BulkShare(BaseModel):
+    usernames: list[str]
+
+
+def grant_shares(session, file_id: int, user_ids: list[int]) -> None:
+    """Grant a file to many users in one multi-row INSERT, ignoring existing grants."""
+    if user_ids:
+        rows = [{"file_id": file_id, "user_id": uid} for uid in user_ids]
+        session.execute(insert(Share).prefix_with("IGNORE").values(rows))
+
 @file_router.post("/share/{file_id}")
 async def share_file(file_id: int, target_username: str, current_user: Annotated[auth.UserSchema, Depends(auth.get_current_user)]):
     with db.transaction() as session:
-        cuser = session.query(User).get(current_user.id)
-        if not cuser:
-            return {"error": "User not found"}
         file = session.query(Files).filter_by(id=file_id, owner_id=current_user.id).first()
         if not file:
             return {"error": "File not found"}, 404
         target_user = session.query(User).filter_by(username=target_username).first()
         if not target_user:
             return {"error": "Target user not found"}, 404
-        shared_file = Files(filename=file.filename, owner_id=target_user.id, size=file.size, original=cuser.id)
-        session.add(shared_file)
+        if target_user.id != current_user.id:
+            grant_shares(session, file_id, [target_user.id])
     return {"status": "File shared", "shared_with": target_username}
 
+@file_router.post("/share/{file_id}/bulk")
+async def share_file_bulk(file_id: int, body: BulkShare, current_user: Annotated[auth.UserSchema, Depends(auth.get_current_user)]):
+    with db.transaction() as session:
+        file = session.query(Files).filter_by(id=file_id, owner_id=current_user.id).first()
+        if not file:
+            return {"error": "File not found"}, 404
+        targets = session.query(User.id, User.username).filter(User.username.in_(body.usernames), User.id != current_user.id).all()
+        grant_shares(session, file_id, [t.id for t in targets])
+    found = {t.username for t in targets}
+    return {"status": "File shared", "shared_with": sorted(found),
+            "not_found": sorted(set(body.usernames) - found - {current_user.username})}
+
+@file_router.delete("/share/{file_id}")
+async def revoke_share(file_id: int, target_username: str, current_user: Annotated[auth.UserSchema, Depends(auth.get_current_user)]):
+    with db.transaction() as session:
+        file = session.query(Files).filter_by(id=file_id, owner_id=current_user.id).first()
+        if not file:
+            return {"error": "File not found"}, 404
+        target_user = session.query(User).filter_by(username=target_username).first()
+        if not target_user:
+            return {"error": "Target user not found"}, 404
+        revoked = session.query(Share).filter_by(file_id=file_id, user_id=target_user.id).delete()
+    if not revoked:
+        return {"error": "File not shared with user"}, 404
+    return {"status": "Share revoked", "revoked_from": target_username}
@@ -0,0 +1,274 @@
+import asyncio
+import logging
+import os
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Annotated
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from starlette.concurrency import run_in_threadpool
+import auth
+import storage
+from db import db, redis, User, Files
+import boto3
+
+resumable_router = APIRouter()
+
+s3 = boto3.client('s3')
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024))  # S3 parts must be >= 5 MiB except the last
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", 24 * 60 * 60))
+FINALIZE_LOCK_TTL = 300
+MAX_UPLOAD_PARTS = 10000  # S3 multipart limit
+SWEEP_LOCK_KEY = "upload:sweep:lock"
+
+logger = logging.getLogger(__name__)
+
+
+def session_key(upload_id: str) -> str:
+    return f"upload:{upload_id}"
+
+
+def parts_key(upload_id: str) -> str:
+    return f"upload:{upload_id}:parts"
+
+
+def s3_upload_key(s3_upload_id: str) -> str:
+    """Marks an S3 multipart upload as owned by a live session; expires with it."""
+    return f"upload:s3:{s3_upload_id}"
+
+
+def part_count(upload: dict) -> int:
+    return -(-int(upload["size"]) // int(upload["chunk_size"]))
+
+
+def contiguous_offset(upload: dict, parts: dict) -> int:
+    """Bytes received without gaps from the start of the file, as reported by HEAD."""
+    done = 0
+    while str(done + 1) in parts:
+        done += 1
+    return min(done * int(upload["chunk_size"]), int(upload["size"]))
+
+
+def get_upload(upload_id: str, user_id: int) -> dict:
+    upload = redis.hgetall(session_key(upload_id))
+    if not upload or int(upload["user_id"]) != user_id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return upload
+
+
+def complete_session(upload_id: str, upload: dict, file_id: int) -> None:
+    """
+    Keep the session around as completed, so a late retry of the last chunk gets the
+    file back instead of creating it twice.
+    """
+    pipe = redis.pipeline()
+    pipe.hset(session_key(upload_id), "file_id", file_id)
+    pipe.expire(session_key(upload_id), UPLOAD_SESSION_TTL)
+    pipe.delete(parts_key(upload_id))
+    pipe.delete(s3_upload_key(upload["s3_upload_id"]))
+    pipe.execute()
+
+
+def completed_response(upload: dict) -> Response:
+    return Response(status_code=201, headers={
+        "Upload-Offset": upload["size"],
+        "Location": f"/api/file/{upload['file_id']}",
+    })
+
+
+def discard_session(upload_id: str) -> None:
+    upload = redis.hgetall(session_key(upload_id))
+    if upload:
+        redis.delete(s3_upload_key(upload["s3_upload_id"]))
+    redis.delete(session_key(upload_id))
+    redis.delete(parts_key(upload_id))
+
+
+def sweep_abandoned_uploads(now: datetime | None = None) -> int:
+    """
+    Abort S3 multipart uploads whose session has expired, so abandoned parts stop being billed.
+
+    A bucket lifecycle rule with AbortIncompleteMultipartUpload on mshare is a useful
+    backstop, but this keeps cleanup tied to UPLOAD_SESSION_TTL.
+
+    Returns:
+        Number of multipart uploads aborted
+    """
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(seconds=UPLOAD_SESSION_TTL)
+    aborted = 0
+    for page in s3.get_paginator("list_multipart_uploads").paginate(Bucket=storage.BUCKET):
+        for multipart in page.get("Uploads", []):
+            if multipart["Initiated"] > cutoff or redis.exists(s3_upload_key(multipart["UploadId"])):
+                continue
+            try:
+                s3.abort_multipart_upload(Bucket=storage.BUCKET, Key=multipart["Key"], UploadId=multipart["UploadId"])
+                aborted += 1
+            except Exception as e:
+                logger.error(f"Error aborting multipart upload {multipart['UploadId']}: {e}")
+    if aborted:
+        logger.info(f"Aborted {aborted} abandoned multipart uploads")
+    return aborted
+
+
+async def upload_sweep_loop(interval: int) -> None:
+    """Run sweep_abandoned_uploads at most once per interval across all workers."""
+    while True:
+        await asyncio.sleep(interval)
+        if not redis.setnx(SWEEP_LOCK_KEY, os.getpid(), ex=interval):
+            continue
+        try:
+            await run_in_threadpool(sweep_abandoned_uploads)
+        except Exception as e:
+            logger.error(f"Error sweeping abandoned uploads: {e}")
+
+
+def finalize_upload(upload_id: str, upload: dict, parts: dict) -> int:
+    """
+    Complete the S3 multipart upload and record the file, charging the owner's quota.
+
+    The quota is checked again here with the owner's row locked, since parallel sessions
+    each passed the check in create_upload; an upload that no longer fits is aborted.
+    """
+    size = int(upload["size"])
+    with db.transaction() as session:
+        cuser = session.query(User).filter_by(id=int(upload["user_id"])).with_for_update().one()
+        if cuser.used + size > cuser.quota:
+            s3.abort_multipart_upload(Bucket=storage.BUCKET, Key=upload["key"], UploadId=upload["s3_upload_id"])
+            discard_session(upload_id)
+            raise HTTPException(status_code=403, detail="Quota exceeded")
+        s3.complete_multipart_upload(
+            Bucket=storage.BUCKET,
+            Key=upload["key"],
+            UploadId=upload["s3_upload_id"],
+            MultipartUpload={"Parts": [{"PartNumber": int(n), "ETag": etag} for n, etag in sorted(parts.items(), key=lambda p: int(p[0]))]},
+        )
+        cuser.used += size
+        file = Files(filename=upload["filename"], owner_id=cuser.id, size=size, stored_size=size)
+        session.add(file)
+        session.flush()
+        file_id = file.id
+    complete_session(upload_id, upload, file_id)
+    return file_id
+
+
+@resumable_router.post("/uploads", status_code=201)
+async def create_upload(filename: str, size: int, response: Response, current_user: Annotated[auth.UserSchema, Depends(auth.get_current_user)]):
+    if size <= 0:
+        raise HTTPException(status_code=400, detail="Use /upload for empty files")
+    if size > UPLOAD_CHUNK_SIZE * MAX_UPLOAD_PARTS:
+        raise HTTPException(status_code=413, detail="Upload exceeds the maximum size")
+    with db.transaction() as session:
+        cuser = session.query(User).get(current_user.id)
+        if not cuser:
+            raise HTTPException(status_code=404, detail="User not found")
+        if cuser.used + size > cuser.quota:
+            raise HTTPException(status_code=403, detail="Quota exceeded")
+    key = storage.object_key(current_user.id, filename)
+    multipart = await run_in_threadpool(s3.create_multipart_upload, Bucket=storage.BUCKET, Key=key)
+    upload_id = secrets.token_urlsafe(16)
+    upload = {
+        "user_id": current_user.id,
+        "filename": filename,
+        "size": size,
+        "chunk_size": UPLOAD_CHUNK_SIZE,
+        "key": key,
+        "s3_upload_id": multipart["UploadId"],
+    }
+    pipe = redis.pipeline()
+    pipe.hset(session_key(upload_id), mapping=upload)
+    pipe.expire(session_key(upload_id), UPLOAD_SESSION_TTL)
+    pipe.setex(s3_upload_key(multipart["UploadId"]), UPLOAD_SESSION_TTL, upload_id)
+    pipe.execute()
+    response.headers["Location"] = f"/api/uploads/{upload_id}"
+    return {"upload_id": upload_id, "chunk_size": UPLOAD_CHUNK_SIZE, "parts": part_count(upload)}
+
+
+@resumable_router.head("/uploads/{upload_id}")
+async def upload_status(upload_id: str, current_user: Annotated[auth.UserSchema, Depends(auth.get_current_user)]):
+    upload = get_upload(upload_id, current_user.id)
+    if "file_id" in upload:
+        return Response(headers={
+            "Upload-Offset": upload["size"],
+            "Upload-Length": upload["size"],
+            "Location": f"/api/file/{upload['file_id']}",
+            "Cache-Control": "no-store",
+        })
+    parts = redis.hgetall(parts_key(upload_id))
+    return Response(headers={
+        "Upload-Offset": str(contiguous_offset(upload, parts)),
+        "Upload-Length": upload["size"],
+        "Upload-Chunk-Size": upload["chunk_size"],
+        "Upload-Parts": ",".join(sorted(parts, key=int)),
+        "Cache-Control": "no-store",
+    })
+
+
+@resumable_router.patch("/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, request: Request, upload_offset: Annotated[int, Header()], current_user: Annotated[auth.UserSchema, Depends(auth.get_current_user)]):
+    """
+    Upload the chunk starting at Upload-Offset as one S3 part.
+
+    Chunks may arrive in any order and in parallel; each must be exactly chunk_size
+    bytes (the last one may be shorter) and starts on a chunk boundary. Re-sending a
+    chunk replaces it, so a client only retries the chunks that failed.
+    """
+    upload = get_upload(upload_id, current_user.id)
+    if "file_id" in upload:
+        return completed_response(upload)
+    size, chunk_size = int(upload["size"]), int(upload["chunk_size"])
+    if upload_offset < 0 or upload_offset >= size or upload_offset % chunk_size:
+        raise HTTPException(status_code=409, detail="Upload-Offset must be a chunk boundary within the upload")
+    expected = min(chunk_size, size - upload_offset)
+    content_length = request.headers.get("content-length")
+    if content_length is not None and content_length != str(expected):
+        raise HTTPException(status_code=400, detail="Chunk has the wrong length")
+    # Never buffer more than one chunk, whatever the client claims
+    body = bytearray()
+    async for data in request.stream():
+        body += data
+        if len(body) > expected:
+            raise HTTPException(status_code=413, detail="Chunk is larger than the upload chunk size")
+    if len(body) != expected:
+        raise HTTPException(status_code=400, detail="Chunk has the wrong length")
+    part_number = upload_offset // chunk_size + 1
+    try:
+        part = await run_in_threadpool(
+            s3.upload_part, Bucket=storage.BUCKET, Key=upload["key"], UploadId=upload["s3_upload_id"],
+            PartNumber=part_number, Body=bytes(body),
+        )
+    except s3.exceptions.NoSuchUpload:
+        # Finalized (or aborted) while this chunk was in flight
+        upload = get_upload(upload_id, current_user.id)
+        if "file_id" in upload:
+            return completed_response(upload)
+        raise HTTPException(status_code=404, detail="Upload not found")
+    pipe = redis.pipeline()
+    pipe.hset(parts_key(upload_id), part_number, part["ETag"])
+    pipe.hgetall(parts_key(upload_id))
+    pipe.expire(session_key(upload_id), UPLOAD_SESSION_TTL)
+    pipe.expire(parts_key(upload_id), UPLOAD_SESSION_TTL)
+    pipe.expire(s3_upload_key(upload["s3_upload_id"]), UPLOAD_SESSION_TTL)
+    _, parts, _, _, _ = pipe.execute()
+    headers = {"Upload-Offset": str(contiguous_offset(upload, parts))}
+    # Whichever request delivers the last missing part finalizes the upload. The lock is
+    # only released on failure; after success it expires and the session stays completed.
+    lock = f"{session_key(upload_id)}:finalizing"
+    if len(parts) == part_count(upload) and redis.setnx(lock, 1, ex=FINALIZE_LOCK_TTL):
+        try:
+            file_id = await run_in_threadpool(finalize_upload, upload_id, upload, parts)
+        except Exception:
+            redis.delete(lock)
+            raise
+        return Response(status_code=201, headers=headers | {"Location": f"/api/file/{file_id}"})
+    return Response(status_code=204, headers=headers)
+
+
+@resumable_router.delete("/uploads/{upload_id}", status_code=204)
+async def abort_upload(upload_id: str, current_user: Annotated[auth.UserSchema, Depends(auth.get_current_user)]):
+    upload = get_upload(upload_id, current_user.id)
+    if "file_id" in upload:
+        raise HTTPException(status_code=409, detail="Upload is already complete")
+    await run_in_threadpool(
+        s3.abort_multipart_upload, Bucket=storage.BUCKET, Key=upload["key"], UploadId=upload["s3_upload_id"]
+    )
+    discard_session(upload_id)
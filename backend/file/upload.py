@@ -1,6 +1,8 @@
 from typing import Annotated
 from fastapi import APIRouter, UploadFile, Depends
+from starlette.concurrency import run_in_threadpool
 import auth
+import storage
 from db import db, User, Files
 import boto3
 
@@ -10,21 +12,27 @@ s3 = boto3.client('s3')
 
 @upload_router.post("/upload")
 async def upload_file(file: UploadFile, current_user: Annotated[auth.UserSchema, Depends(auth.get_current_user)], do_s3:bool=False):
+    if file.size:
+        size = file.size
+    else:
+        file.file.seek(0, 2)  # Move to end of file
+        size = file.file.tell()
+        file.file.seek(0)  # Reset to start of file
     with db.transaction() as session:
         cuser = session.query(User).get(current_user.id)
         if not cuser:
             return {"error": "User not found"}
-        # Save file metadata to database
-        if cuser.quota <= session.query(Files).filter_by(owner_id=current_user.id).count():
+        # Checked against the logical size, since the stored size is only known after upload
+        if cuser.used + size > cuser.quota:
             return {"error": "Quota exceeded"}, 403
-        if file.size:
-           cuser.used += file.size
-        else:
-            file.file.seek(0, 2)  # Move to end of file
-            size = file.file.tell()
-            cuser.used += size
-            file.file.seek(0)  # Reset to start of file
-        session.add(Files(filename=file.filename, owner_id=current_user.id, original=current_user.id, size=file.size or size))
+    compression, stored_size = None, size
     if do_s3:
-        s3.upload_fileobj(file.file, "mshare", cuser.id+"/"+file.filename)
-    return {"filename": file.filename}
+        compression, stored_size = await run_in_threadpool(
+            storage.upload_object, s3, file.file, storage.BUCKET, storage.object_key(current_user.id, file.filename)
+        )
+    # Save file metadata to database, charging the quota for what is actually stored
+    with db.transaction() as session:
+        cuser = session.query(User).get(current_user.id)
+        cuser.used += stored_size
+        session.add(Files(filename=file.filename, owner_id=current_user.id, size=size, stored_size=stored_size, compression=compression))
+    return {"filename": file.filename, "size": size, "stored_size": stored_size}
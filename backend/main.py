@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+import asyncio
 import os
 from dotenv import load_dotenv
 
@@ -9,11 +10,17 @@ else:
     load_dotenv()
 
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from db import db
+from serialize import ORJSONResponse
 from auth import router as auth_router
-from file import file_router as file_router, upload_router as file_upload_router
+from file import file_router as file_router, upload_router as file_upload_router, resumable_router, upload_sweep_loop
+from admin import admin_router
+import storage
+from ratelimit import RateLimitMiddleware
+from profiling import ProfilingMiddleware, install_slow_query_hook
 from sys import argv
 import uvicorn
 
@@ -24,18 +31,44 @@ origins = [
     "http://localhost:3000",
 ]
 
-app = FastAPI()
+ACCESS_FLUSH_INTERVAL = int(os.getenv("ACCESS_FLUSH_INTERVAL", 60))
+TIERING_INTERVAL = int(os.getenv("TIERING_INTERVAL", 0))
+UPLOAD_SWEEP_INTERVAL = int(os.getenv("UPLOAD_SWEEP_INTERVAL", 3600))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = [
+        asyncio.create_task(storage.access_flush_loop(ACCESS_FLUSH_INTERVAL)),
+        asyncio.create_task(upload_sweep_loop(UPLOAD_SWEEP_INTERVAL)),
+    ]
+    if TIERING_INTERVAL > 0:
+        tasks.append(asyncio.create_task(storage.lifecycle_loop(storage.s3, TIERING_INTERVAL)))
+    yield
+    for task in tasks:
+        task.cancel()
+
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(RateLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Resumable uploads, rate limiting and downloads are driven by these from the browser
+    expose_headers=["Location", "Retry-After", "Upload-Offset", "Upload-Length", "Upload-Chunk-Size", "Upload-Parts", "Content-Disposition"],
 )
 app.include_router(auth_router, tags=["auth"], prefix="/api")
 app.include_router(auth_router, tags=["auth_alt"])
 app.include_router(file_router, tags=["files"], prefix="/api")
 app.include_router(file_upload_router, tags=["files"], prefix="/api")
+app.include_router(resumable_router, tags=["files"], prefix="/api")
+app.include_router(admin_router, tags=["admin"], prefix="/api")
+
+install_slow_query_hook(db.engine)
 
 
 @app.get("/")
@@ -52,6 +85,11 @@ if __name__ == "__main__":
         except Exception as e:
             print(f"Error setting up database: {e}")
 
+    if "--tiering" in argv:
+        storage.flush_access_counters()
+        moved = storage.run_lifecycle(storage.s3)
+        print(f"Lifecycle completed, {moved} objects moved.")
+        exit(0)
 
     if "--reload" in argv:
         uvicorn.run("main:app", host="127.0.0.1", port=int(os.getenv("PORT", 8000)), reload=True)
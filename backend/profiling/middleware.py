@@ -0,0 +1,102 @@
+import cProfile
+import logging
+import os
+import random
+import re
+import time
+from collections import deque
+from contextvars import ContextVar
+from pathlib import Path
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from db import utcnow
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")  # X-Profile header value that forces a profile
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "data/profiles"))
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", 500))
+SLOW_BUFFER_SIZE = int(os.getenv("SLOW_BUFFER_SIZE", 100))
+
+logger = logging.getLogger(__name__)
+
+# "METHOD /path" of the request being handled, for attributing slow queries
+current_route: ContextVar[str | None] = ContextVar("current_route", default=None)
+
+# Per-worker ring buffers of recent slow requests and statements
+slow_requests: deque[dict] = deque(maxlen=SLOW_BUFFER_SIZE)
+slow_queries: deque[dict] = deque(maxlen=SLOW_BUFFER_SIZE)
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware timing every request and profiling selected ones with cProfile.
+
+    A request is profiled when it carries `X-Profile: <PROFILE_TOKEN>` or is picked by
+    PROFILE_SAMPLE_RATE. Only one request per worker is profiled at a time, and the
+    profile covers everything the event loop thread runs meanwhile. Reports are written
+    to PROFILE_DIR as .prof files for pstats/snakeviz.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.profiling = False
+
+    def wants_profile(self, scope: Scope) -> bool:
+        if PROFILE_TOKEN:
+            for name, value in scope["headers"]:
+                if name == b"x-profile":
+                    return value.decode("latin-1") == PROFILE_TOKEN
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+    def start_profile(self) -> cProfile.Profile | None:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # another profiler is already active in this process
+            return None
+        self.profiling = True
+        return profiler
+
+    def dump_profile(self, profiler: cProfile.Profile, route: str, elapsed_ms: float) -> None:
+        profiler.disable()
+        self.profiling = False
+        try:
+            PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            name = re.sub(r"[^A-Za-z0-9_.-]+", "_", route).strip("_")
+            path = PROFILE_DIR / f"{int(time.time() * 1000)}-{name}.prof"
+            profiler.dump_stats(path)
+            logger.info(f"Profiled {route} ({elapsed_ms:.1f} ms) to {path}")
+        except OSError as e:
+            logger.error(f"Error writing profile for {route}: {e}")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = f"{scope['method']} {scope['path']}"
+        status = 500
+
+        async def send_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        profiler = None
+        if not self.profiling and self.wants_profile(scope):
+            profiler = self.start_profile()
+        reset = current_route.set(route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            current_route.reset(reset)
+            if profiler:
+                self.dump_profile(profiler, route, elapsed_ms)
+            if elapsed_ms >= SLOW_REQUEST_MS:
+                slow_requests.append({
+                    "route": route,
+                    "status": status,
+                    "duration_ms": round(elapsed_ms, 2),
+                    "at": utcnow().isoformat(),
+                })
@@ -0,0 +1,46 @@
+import logging
+import os
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from db import utcnow
+from .middleware import current_route, slow_queries
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 200))
+MAX_PARAMS_LENGTH = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def install_slow_query_hook(engine: Engine, threshold_ms: float = SLOW_QUERY_MS) -> None:
+    """
+    Capture statements slower than threshold_ms with their parameters and calling route.
+
+    Unlike echo=True only slow statements are logged, so it is cheap enough to leave on.
+    """
+    if threshold_ms <= 0:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info["query_start"].pop()) * 1000
+        if elapsed_ms < threshold_ms:
+            return
+        entry = {
+            "statement": statement,
+            "parameters": repr(parameters)[:MAX_PARAMS_LENGTH],
+            "route": current_route.get(),
+            "duration_ms": round(elapsed_ms, 2),
+            "at": utcnow().isoformat(),
+        }
+        slow_queries.append(entry)
+        logger.warning(f"Slow query ({entry['duration_ms']} ms) from {entry['route']}: {statement}")
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get("query_start"):
+            context.connection.info["query_start"].pop()
@@ -0,0 +1 @@
+from .middleware import *
@@ -0,0 +1,153 @@
+import logging
+import os
+import re
+import jwt
+from pydantic import BaseModel, TypeAdapter
+from redis.exceptions import RedisError
+from starlette.types import ASGIApp, Receive, Scope, Send
+from auth.hash import ALGORITHM
+from db import db, redis
+from serialize import ORJSONResponse
+
+logger = logging.getLogger(__name__)
+
+# Refill the bucket from the elapsed time, then try to take `cost` tokens.
+# Runs atomically in Redis so a check is a single EVALSHA round-trip.
+TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local retry_after = 0
+if tokens >= cost then
+  tokens = tokens - cost
+else
+  retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(retry_after)
+"""
+
+
+class RouteLimit(BaseModel):
+    rate: float  # tokens refilled per second
+    burst: int  # bucket capacity
+    concurrency: int | None = None  # max in-flight requests of this group per worker
+
+
+DEFAULT_LIMITS = {
+    "auth": RouteLimit(rate=1, burst=10),
+    "metadata": RouteLimit(rate=20, burst=60),
+    "transfers": RouteLimit(rate=2, burst=10, concurrency=8),
+    "chunks": RouteLimit(rate=10, burst=40, concurrency=16),
+}
+
+ROUTE_GROUPS = [
+    ("auth", re.compile(r"^(/api)?/(token|refresh|register|logout|user/)")),
+    ("chunks", re.compile(r"^(/api)?/uploads/")),
+    ("transfers", re.compile(r"^(/api)?/(upload|file/\d+/(download|content)|files/export)")),
+    ("metadata", re.compile(r"^/")),
+]
+
+# The DB pool is per worker, so by default shed load before every pooled connection is taken
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", db.pool_size + db.max_overflow))
+# A stalled Redis must not hold requests up; past this the limiter fails open
+RATE_LIMIT_REDIS_TIMEOUT = float(os.getenv("RATE_LIMIT_REDIS_TIMEOUT", 0.1))
+
+
+def load_limits() -> dict[str, RouteLimit]:
+    """Default limits, overridden per group by the RATE_LIMITS JSON object."""
+    raw = os.getenv("RATE_LIMITS")
+    if not raw:
+        return DEFAULT_LIMITS
+    return DEFAULT_LIMITS | TypeAdapter(dict[str, RouteLimit]).validate_json(raw)
+
+
+def route_group(path: str) -> str | None:
+    for group, pattern in ROUTE_GROUPS:
+        if pattern.match(path):
+            return group
+    return None
+
+
+def client_identity(scope: Scope) -> str:
+    """The token's subject for authenticated requests, the client address otherwise."""
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer":
+                try:
+                    payload = jwt.decode(token, os.environ["JWT_KEY"], algorithms=[ALGORITHM])
+                    return f"user:{payload['sub']}"
+                except (jwt.InvalidTokenError, KeyError):
+                    pass
+            break
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware combining Redis token buckets with per-worker admission control.
+
+    Requests over their group's token bucket get 429; requests arriving while the
+    worker is at its in-flight cap (global or per group) get 503, both with Retry-After.
+    """
+
+    def __init__(self, app: ASGIApp, limits: dict[str, RouteLimit] | None = None, max_in_flight: int | None = None):
+        self.app = app
+        self.limits = limits or load_limits()
+        self.max_in_flight = max_in_flight or MAX_IN_FLIGHT
+        self.in_flight = 0
+        self.group_in_flight = dict.fromkeys(self.limits, 0)
+        client = redis.async_client(
+            socket_timeout=RATE_LIMIT_REDIS_TIMEOUT, socket_connect_timeout=RATE_LIMIT_REDIS_TIMEOUT
+        )
+        self.token_bucket = client.register_script(TOKEN_BUCKET_LUA)
+
+    async def take_token(self, group: str, identity: str, limit: RouteLimit) -> float:
+        """Returns 0 if the request may proceed, otherwise seconds until a token is available."""
+        try:
+            return float(await self.token_bucket(keys=[f"ratelimit:{group}:{identity}"], args=[limit.rate, limit.burst, 1]))
+        except RedisError as e:
+            logger.error(f"Rate limiter unavailable, allowing request: {e}")
+            return 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        group = route_group(scope["path"])
+        limit = self.limits.get(group)
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        if self.in_flight >= self.max_in_flight or (
+            limit.concurrency is not None and self.group_in_flight[group] >= limit.concurrency
+        ):
+            await self.reject(503, "Server busy", 1, scope, receive, send)
+            return
+        retry_after = await self.take_token(group, client_identity(scope), limit)
+        if retry_after > 0:
+            await self.reject(429, "Too many requests", retry_after, scope, receive, send)
+            return
+        self.in_flight += 1
+        self.group_in_flight[group] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+            self.group_in_flight[group] -= 1
+
+    @staticmethod
+    async def reject(status_code: int, detail: str, retry_after: float, scope: Scope, receive: Receive, send: Send) -> None:
+        response = ORJSONResponse(
+            {"detail": detail}, status_code=status_code, headers={"Retry-After": str(max(1, round(retry_after + 0.5)))}
+        )
+        await response(scope, receive, send)
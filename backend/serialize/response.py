@@ -0,0 +1,94 @@
+import csv
+import io
+import orjson
+from typing import Any, Iterable, Iterator
+from urllib.parse import quote
+from fastapi.responses import ORJSONResponse, StreamingResponse
+
+
+JSON_CHUNK_ROWS = 500
+
+EXPORT_FORMATS = {
+    "jsonl": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def json_array_chunks(rows: Iterable[Any], chunk_rows: int = JSON_CHUNK_ROWS) -> Iterator[bytes]:
+    """Encode rows as a single JSON array, yielding it in chunks of encoded rows."""
+    yield b"["
+    sep = b""
+    batch = []
+    for row in rows:
+        batch.append(orjson.dumps(row))
+        if len(batch) >= chunk_rows:
+            yield sep + b",".join(batch)
+            sep = b","
+            batch = []
+    if batch:
+        yield sep + b",".join(batch)
+    yield b"]"
+
+
+def jsonl_chunks(rows: Iterable[Any], chunk_rows: int = JSON_CHUNK_ROWS) -> Iterator[bytes]:
+    """Encode rows as JSON Lines, yielding chunks of complete lines."""
+    batch = []
+    for row in rows:
+        batch.append(orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE))
+        if len(batch) >= chunk_rows:
+            yield b"".join(batch)
+            batch = []
+    if batch:
+        yield b"".join(batch)
+
+
+def csv_chunks(rows: Iterable[dict], chunk_rows: int = JSON_CHUNK_ROWS) -> Iterator[bytes]:
+    """Encode dict rows as CSV with a header taken from the first row's keys."""
+    buffer = io.StringIO()
+    writer = None
+    pending = 0
+    for row in rows:
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(row.keys()))
+            writer.writeheader()
+        writer.writerow(row)
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def content_disposition(filename: str) -> str:
+    """Attachment header value; non-ASCII or quote-bearing names use RFC 5987 encoding like FileResponse."""
+    quoted = quote(filename, safe="")
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def stream_json_array(rows: Iterable[Any], status_code: int = 200) -> StreamingResponse:
+    """Stream rows to the client as a JSON array without materializing the list."""
+    return StreamingResponse(
+        json_array_chunks(rows), status_code=status_code, media_type="application/json"
+    )
+
+
+def stream_export(rows: Iterable[dict], fmt: str, filename: str) -> StreamingResponse:
+    """
+    Stream rows as a downloadable JSON Lines or CSV export.
+
+    Args:
+        rows: Iterable of dict rows, typically from MariaDB.query_stream
+        fmt: One of EXPORT_FORMATS
+        filename: Base name for the attachment, without extension
+    """
+    chunks = jsonl_chunks(rows) if fmt == "jsonl" else csv_chunks(rows)
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": content_disposition(f"{filename}.{fmt}")},
+    )
@@ -0,0 +1,2 @@
+from .tiering import *
+from .compression import *
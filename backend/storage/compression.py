@@ -0,0 +1,96 @@
+import math
+import os
+from collections import Counter
+from typing import BinaryIO, Iterator
+import zstandard
+
+ZSTD = "zstd"
+
+COMPRESS_UPLOADS = os.getenv("COMPRESS_UPLOADS", "true").lower() == "true"
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", 3))
+
+SNIFF_SIZE = 64 * 1024
+MIN_COMPRESS_SIZE = 1024
+ENTROPY_THRESHOLD = 7.2  # bits per byte; already-compressed data sits close to 8
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Leading bytes of formats that are already compressed
+COMPRESSED_MAGIC = (
+    b"\x1f\x8b",  # gzip
+    b"\x28\xb5\x2f\xfd",  # zstd
+    b"PK\x03\x04",  # zip, docx, xlsx, jar
+    b"BZh",  # bzip2
+    b"\xfd7zXZ\x00",  # xz
+    b"7z\xbc\xaf\x27\x1c",  # 7z
+    b"Rar!",
+    b"\x89PNG",
+    b"\xff\xd8\xff",  # jpeg
+    b"GIF8",
+    b"OggS",
+    b"fLaC",
+    b"ID3",  # mp3
+)
+
+
+def byte_entropy(data: bytes) -> float:
+    """Shannon entropy of data in bits per byte."""
+    if not data:
+        return 0.0
+    total = len(data)
+    return -sum(n / total * math.log2(n / total) for n in Counter(data).values())
+
+
+def should_compress(head: bytes) -> bool:
+    """Decide from the first chunk of a file whether compressing it is worthwhile."""
+    if not COMPRESS_UPLOADS or len(head) < MIN_COMPRESS_SIZE:
+        return False
+    if head.startswith(COMPRESSED_MAGIC) or head[4:8] == b"ftyp":  # mp4/mov/heic
+        return False
+    return byte_entropy(head) < ENTROPY_THRESHOLD
+
+
+class CountingReader:
+    """File-like wrapper counting the bytes read through it."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.count += len(data)
+        return data
+
+
+def upload_object(s3_client, fileobj: BinaryIO, bucket: str, key: str) -> tuple[str | None, int]:
+    """
+    Upload a seekable file to S3, zstd-compressing it on the fly when the sniffed head looks compressible.
+
+    Compressed objects carry Content-Encoding: zstd so clients that support it decode them transparently.
+
+    Returns:
+        Compression used (or None) and the number of bytes stored
+    """
+    head = fileobj.read(SNIFF_SIZE)
+    fileobj.seek(0)
+    if should_compress(head):
+        compression = ZSTD
+        source = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_reader(fileobj)
+        extra_args = {"ContentEncoding": ZSTD}
+    else:
+        compression = None
+        source = fileobj
+        extra_args = {}
+    counter = CountingReader(source)
+    s3_client.upload_fileobj(counter, bucket, key, ExtraArgs=extra_args)
+    return compression, counter.count
+
+
+def decompressed_chunks(body, compression: str | None) -> Iterator[bytes]:
+    """Yield the logical content of an S3 object body, decompressing chunk by chunk."""
+    if compression == ZSTD:
+        reader = zstandard.ZstdDecompressor().stream_reader(body)
+        while chunk := reader.read(STREAM_CHUNK_SIZE):
+            yield chunk
+    else:
+        yield from body.iter_chunks(STREAM_CHUNK_SIZE)
@@ -0,0 +1,298 @@
+import asyncio
+import gzip
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from botocore.exceptions import ClientError
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import bindparam, select, update
+from starlette.concurrency import run_in_threadpool
+from db import db, redis, Files, utcnow
+import boto3
+
+BUCKET = "mshare"
+HOT_TIER = "hot"
+ARCHIVE_TIER = "archive"
+ARCHIVE_PREFIX = "archive/"
+
+ACCESS_COUNTS_KEY = "access:counts"
+ACCESS_LAST_KEY = "access:last"
+ACCESS_FLUSH_LOCK_KEY = "access:flush:lock"
+PROCESSING_SUFFIX = ":processing"
+LIFECYCLE_LOCK_KEY = "lifecycle:lock"
+FLUSH_LOCK_TTL = 60
+
+TRANSFER_CHUNK_SIZE = 1024 * 1024
+SPOOL_MAX_SIZE = 16 * 1024 * 1024
+
+s3 = boto3.client('s3')
+
+logger = logging.getLogger(__name__)
+
+
+class TierPolicy(BaseModel):
+    """Objects idle for at least `idle_days` move to `tier` (an S3 storage class or "archive")."""
+    tier: str
+    idle_days: int
+
+
+DEFAULT_POLICIES = [
+    TierPolicy(tier="STANDARD_IA", idle_days=30),
+    TierPolicy(tier=ARCHIVE_TIER, idle_days=180),
+]
+
+
+def load_policies() -> list[TierPolicy]:
+    """Read policies from the TIERING_POLICIES JSON list, falling back to the defaults."""
+    raw = os.getenv("TIERING_POLICIES")
+    if not raw:
+        return DEFAULT_POLICIES
+    return TypeAdapter(list[TierPolicy]).validate_json(raw)
+
+
+def object_key(owner_id: int, filename: str) -> str:
+    return f"{owner_id}/{filename}"
+
+
+def archive_key(owner_id: int, filename: str) -> str:
+    return f"{ARCHIVE_PREFIX}{object_key(owner_id, filename)}.gz"
+
+
+def stored_key(owner_id: int, filename: str, tier: str) -> str:
+    """The key a file's bytes live under in its current tier."""
+    return archive_key(owner_id, filename) if tier == ARCHIVE_TIER else object_key(owner_id, filename)
+
+
+def object_exists(s3_client, key: str) -> bool:
+    try:
+        s3_client.head_object(Bucket=BUCKET, Key=key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return False
+        raise
+    return True
+
+
+def record_access(file_id: int) -> None:
+    """Count a download in Redis; flush_access_counters moves the counts to MariaDB."""
+    pipe = redis.pipeline()
+    pipe.hincrby(ACCESS_COUNTS_KEY, file_id, 1)
+    pipe.hset(ACCESS_LAST_KEY, file_id, int(time.time()))
+    pipe.execute()
+
+
+def flush_access_counters() -> int:
+    """
+    Drain the Redis access counters into Files in one batched UPDATE.
+
+    The counters are renamed to processing keys and only deleted once the UPDATE
+    has committed; a batch left behind by a failed flush is retried first.
+
+    Returns:
+        Number of files updated
+    """
+    if not redis.setnx(ACCESS_FLUSH_LOCK_KEY, os.getpid(), ex=FLUSH_LOCK_TTL):
+        return 0
+    try:
+        return _flush_access_batch()
+    finally:
+        redis.delete(ACCESS_FLUSH_LOCK_KEY)
+
+
+def _flush_access_batch() -> int:
+    counts_key = ACCESS_COUNTS_KEY + PROCESSING_SUFFIX
+    last_key = ACCESS_LAST_KEY + PROCESSING_SUFFIX
+    if not redis.exists(counts_key):
+        if not redis.exists(ACCESS_COUNTS_KEY):
+            return 0
+        pipe = redis.pipeline()
+        pipe.rename(ACCESS_COUNTS_KEY, counts_key)
+        pipe.rename(ACCESS_LAST_KEY, last_key)
+        pipe.execute()
+    pipe = redis.pipeline()
+    pipe.hgetall(counts_key)
+    pipe.hgetall(last_key)
+    counts, last = pipe.execute()
+    params = [
+        {
+            "fid": int(fid),
+            "hits": int(hits),
+            "ts": datetime.fromtimestamp(int(last.get(fid, time.time())), timezone.utc).replace(tzinfo=None),
+        }
+        for fid, hits in counts.items()
+    ]
+    files = Files.__table__
+    stmt = (
+        update(files)
+        .where(files.c.id == bindparam("fid"))
+        .values(access_count=files.c.access_count + bindparam("hits"), last_accessed=bindparam("ts"))
+    )
+    with db.transaction() as session:
+        session.execute(stmt, params)
+    pipe = redis.pipeline()
+    pipe.delete(counts_key, last_key)
+    pipe.execute()
+    return len(params)
+
+
+def set_tier(file_id: int, tier: str) -> None:
+    with db.transaction() as session:
+        session.query(Files).filter_by(id=file_id).update({"tier": tier})
+
+
+def archive_object(s3_client, owner_id: int, filename: str) -> None:
+    """Gzip an object chunk by chunk into the archive prefix; the original is left in place."""
+    key = object_key(owner_id, filename)
+    obj = s3_client.get_object(Bucket=BUCKET, Key=key)
+    # Keep the object's own encoding so restore_object can put it back
+    metadata = {"content-encoding": obj["ContentEncoding"]} if obj.get("ContentEncoding") else {}
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as spool:
+        with gzip.GzipFile(fileobj=spool, mode="wb") as gz:
+            for chunk in obj["Body"].iter_chunks(TRANSFER_CHUNK_SIZE):
+                gz.write(chunk)
+        spool.seek(0)
+        s3_client.upload_fileobj(spool, BUCKET, archive_key(owner_id, filename), ExtraArgs={"Metadata": metadata})
+
+
+def move_object(s3_client, file_id: int, owner_id: int, filename: str, tier: str) -> None:
+    """Move a file's object into `tier` and record it on its Files row."""
+    key = object_key(owner_id, filename)
+    if tier == ARCHIVE_TIER:
+        archive_object(s3_client, owner_id, filename)
+    else:
+        s3_client.copy(
+            {"Bucket": BUCKET, "Key": key}, BUCKET, key,
+            ExtraArgs={"StorageClass": tier, "MetadataDirective": "COPY"},
+        )
+    set_tier(file_id, tier)
+    if tier == ARCHIVE_TIER:
+        # Only drop the hot copy once the row points at the archive
+        s3_client.delete_object(Bucket=BUCKET, Key=key)
+
+
+def restore_object(s3_client, file_id: int, owner_id: int, filename: str, tier: str) -> None:
+    """Bring a file's object back to the hot tier; archived objects are decompressed chunk by chunk."""
+    key = object_key(owner_id, filename)
+    if tier == ARCHIVE_TIER:
+        try:
+            obj = s3_client.get_object(Bucket=BUCKET, Key=archive_key(owner_id, filename))
+        except s3_client.exceptions.NoSuchKey:
+            # A concurrent restore got here first; it uploads the hot copy before deleting the archive
+            s3_client.head_object(Bucket=BUCKET, Key=key)
+            set_tier(file_id, HOT_TIER)
+            return
+        encoding = obj.get("Metadata", {}).get("content-encoding")
+        extra_args = {"ContentEncoding": encoding} if encoding else {}
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as spool:
+            with gzip.GzipFile(fileobj=obj["Body"], mode="rb") as gz:
+                while chunk := gz.read(TRANSFER_CHUNK_SIZE):
+                    spool.write(chunk)
+            spool.seek(0)
+            s3_client.upload_fileobj(spool, BUCKET, key, ExtraArgs=extra_args)
+    elif tier != HOT_TIER:
+        s3_client.copy(
+            {"Bucket": BUCKET, "Key": key}, BUCKET, key,
+            ExtraArgs={"StorageClass": "STANDARD", "MetadataDirective": "COPY"},
+        )
+    set_tier(file_id, HOT_TIER)
+    if tier == ARCHIVE_TIER:
+        s3_client.delete_object(Bucket=BUCKET, Key=archive_key(owner_id, filename))
+
+
+def copy_renamed_object(s3_client, owner_id: int, filename: str, new_filename: str, tier: str) -> bool:
+    """
+    Copy a file's object to the key of `new_filename`, keeping its storage class and metadata.
+
+    Returns:
+        False if the file has no object in storage
+    """
+    source = stored_key(owner_id, filename, tier)
+    if not object_exists(s3_client, source):
+        return False
+    extra_args = {"MetadataDirective": "COPY"}
+    if tier not in (HOT_TIER, ARCHIVE_TIER):
+        extra_args["StorageClass"] = tier
+    s3_client.copy({"Bucket": BUCKET, "Key": source}, BUCKET, stored_key(owner_id, new_filename, tier), ExtraArgs=extra_args)
+    return True
+
+
+def recover_hot_object(s3_client, file_id: int, owner_id: int, filename: str) -> bool:
+    """
+    Make sure the hot key exists before it is served, restoring it from the archive if not.
+
+    A request that read the row just before an archive move committed still sees the
+    old tier while the hot key is already gone.
+
+    Returns:
+        False if the object is in neither the hot nor the archive key
+    """
+    if object_exists(s3_client, object_key(owner_id, filename)):
+        return True
+    if not object_exists(s3_client, archive_key(owner_id, filename)):
+        return False
+    restore_object(s3_client, file_id, owner_id, filename, ARCHIVE_TIER)
+    return True
+
+
+def run_lifecycle(s3_client, policies: list[TierPolicy] | None = None, now: datetime | None = None) -> int:
+    """
+    Apply tiering policies to every stored object.
+
+    Objects only ever move to colder tiers here; restore_object brings them back
+    when they are downloaded again.
+
+    Args:
+        s3_client: boto3 S3 client
+        policies: Policies to apply, defaults to load_policies()
+        now: Reference time for idleness, defaults to the current UTC time
+
+    Returns:
+        Number of objects moved
+    """
+    policies = sorted(policies or load_policies(), key=lambda p: p.idle_days)
+    if not policies:
+        return 0
+    now = now or utcnow()
+    rank = {HOT_TIER: -1} | {p.tier: i for i, p in enumerate(policies)}
+    with db.transaction() as session:
+        candidates = session.execute(
+            select(Files.id, Files.owner_id, Files.filename, Files.tier, Files.last_accessed)
+            .where(Files.last_accessed <= now - timedelta(days=policies[0].idle_days))
+        ).all()
+    moved = 0
+    for file_id, owner_id, filename, tier, accessed in candidates:
+        target = [p.tier for p in policies if now - accessed >= timedelta(days=p.idle_days)][-1]
+        if rank.get(tier, len(policies)) >= rank[target]:
+            continue
+        try:
+            move_object(s3_client, file_id, owner_id, filename, target)
+            moved += 1
+        except Exception as e:
+            logger.error(f"Error moving {object_key(owner_id, filename)} to {target}: {e}")
+    logger.info(f"Lifecycle moved {moved} objects")
+    return moved
+
+
+async def access_flush_loop(interval: int) -> None:
+    """Periodically flush access counters; safe to run in every worker."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(flush_access_counters)
+        except Exception as e:
+            logger.error(f"Error flushing access counters: {e}")
+
+
+async def lifecycle_loop(s3_client, interval: int) -> None:
+    """Run the lifecycle job at most once per interval across all workers."""
+    while True:
+        await asyncio.sleep(interval)
+        if not redis.setnx(LIFECYCLE_LOCK_KEY, os.getpid(), ex=interval):
+            continue
+        try:
+            await run_in_threadpool(flush_access_counters)
+            await run_in_threadpool(run_lifecycle, s3_client)
+        except Exception as e:
+            logger.error(f"Error running lifecycle: {e}")
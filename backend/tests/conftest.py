@@ -0,0 +1,18 @@
+import os
+import sys
+
+# db/__init__.py builds its clients from the environment at import time
+os.environ.update({
+    "JWT_KEY": "test",
+    "DB_HOST": "localhost",
+    "DB_PORT": "3306",
+    "DB_USER": "test",
+    "DB_PASSWORD": "test",
+    "DB_NAME": "test",
+    "REDIS_HOST": "localhost",
+    "REDIS_PORT": "6379",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "test",
+    "AWS_SECRET_ACCESS_KEY": "test",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+
+import boto3
+import fakeredis
+import pytest
+from fastapi import BackgroundTasks
+from moto import mock_aws
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import storage
+from db import Base, MariaDB, User, Files, Share
+from file import get
+from storage import tiering
+
+
+@pytest.fixture
+def database(monkeypatch):
+    """An in-memory SQLite stand-in for MariaDB."""
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine, tables=[User.__table__, Files.__table__, Share.__table__])
+    test_db = MariaDB.__new__(MariaDB)
+    test_db.engine = engine
+    test_db.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    test_db.logger = logging.getLogger("test")
+    monkeypatch.setattr(get, "db", test_db)
+    monkeypatch.setattr(tiering, "db", test_db)
+    return test_db
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    with mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=storage.BUCKET)
+        monkeypatch.setattr(get, "s3", client)
+        monkeypatch.setattr(tiering.redis, "client", fakeredis.FakeStrictRedis(decode_responses=True))
+        yield client
+
+
+def test_grantee_sees_renamed_file_and_can_download_it(database, s3):
+    owner, grantee = SimpleNamespace(id=1, username="ann"), SimpleNamespace(id=2, username="bob")
+    with database.transaction() as session:
+        session.add_all([
+            User(id=1, username="ann", email="ann@example.com", password="x"),
+            User(id=2, username="bob", email="bob@example.com", password="x"),
+            Files(id=10, filename="draft.txt", owner_id=1, size=5, stored_size=5),
+            Files(id=11, filename="taken.txt", owner_id=1, size=5, stored_size=5),
+        ])
+        session.flush()
+        session.add(Share(file_id=10, user_id=2))
+    s3.put_object(Bucket=storage.BUCKET, Key=storage.object_key(1, "draft.txt"), Body=b"hello")
+
+    assert asyncio.run(get.rename_file(10, "final.txt", owner))["new_name"] == "final.txt"
+    assert asyncio.run(get.rename_file(10, "taken.txt", owner))[1] == 409
+
+    assert asyncio.run(get.get_file(10, grantee))["filename"] == "final.txt"
+    download = asyncio.run(get.download_file(10, BackgroundTasks(), grantee))
+    assert download["error"] is None
+    assert download["filename"] == "final.txt"
+    assert s3.get_object(Bucket=storage.BUCKET, Key=storage.object_key(1, "final.txt"))["Body"].read() == b"hello"
+    assert not storage.object_exists(s3, storage.object_key(1, "draft.txt"))
+
+
+def test_rename_moves_archived_object(database, s3):
+    with database.transaction() as session:
+        session.add_all([
+            User(id=1, username="ann", email="ann@example.com", password="x"),
+            Files(id=10, filename="old.txt", owner_id=1, size=5, stored_size=5, tier=storage.ARCHIVE_TIER),
+        ])
+    s3.put_object(Bucket=storage.BUCKET, Key=storage.object_key(1, "old.txt"), Body=b"hello")
+    storage.archive_object(s3, 1, "old.txt")
+    s3.delete_object(Bucket=storage.BUCKET, Key=storage.object_key(1, "old.txt"))
+
+    asyncio.run(get.rename_file(10, "new.txt", SimpleNamespace(id=1, username="ann")))
+    assert storage.object_exists(s3, storage.archive_key(1, "new.txt"))
+    assert not storage.object_exists(s3, storage.archive_key(1, "old.txt"))
@@ -0,0 +1,46 @@
+import asyncio
+
+import fakeredis
+import pytest
+from redis.exceptions import TimeoutError
+
+from ratelimit import RateLimitMiddleware, RouteLimit
+from ratelimit import middleware
+
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def call(app) -> int:
+    scope = {"type": "http", "method": "GET", "path": "/api/list_files", "headers": [], "client": ("10.0.0.1", 1)}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return sent[0]["status"]
+
+
+@pytest.fixture
+def limiter():
+    app = RateLimitMiddleware(ok_app, limits={"metadata": RouteLimit(rate=0.01, burst=2)})
+    app.token_bucket = fakeredis.FakeAsyncRedis(decode_responses=True).register_script(middleware.TOKEN_BUCKET_LUA)
+    return app
+
+
+def test_bucket_rejects_over_burst(limiter):
+    assert [call(limiter) for _ in range(3)] == [200, 200, 429]
+
+
+def test_fails_open_when_redis_times_out(limiter):
+    async def stalled(**kwargs):
+        raise TimeoutError("Timeout reading from socket")
+
+    limiter.token_bucket = stalled
+    assert call(limiter) == 200
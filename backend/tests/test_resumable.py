@@ -0,0 +1,55 @@
+import asyncio
+from datetime import timedelta
+from types import SimpleNamespace
+
+import boto3
+import fakeredis
+import pytest
+from fastapi import HTTPException
+from moto import mock_aws
+
+import storage
+from file import resumable
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    with mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=storage.BUCKET)
+        monkeypatch.setattr(resumable, "s3", client)
+        monkeypatch.setattr(resumable.redis, "client", fakeredis.FakeStrictRedis(decode_responses=True))
+        yield client
+
+
+def test_sweep_aborts_only_uploads_without_a_session(s3):
+    live = s3.create_multipart_upload(Bucket=storage.BUCKET, Key="1/live.bin")["UploadId"]
+    abandoned = s3.create_multipart_upload(Bucket=storage.BUCKET, Key="1/abandoned.bin")["UploadId"]
+    resumable.redis.setex(resumable.s3_upload_key(live), "session", 60)
+    initiated = max(u["Initiated"] for u in s3.list_multipart_uploads(Bucket=storage.BUCKET)["Uploads"])
+
+    # Both are younger than the session TTL
+    assert resumable.sweep_abandoned_uploads(now=initiated + timedelta(seconds=60)) == 0
+    later = initiated + timedelta(seconds=resumable.UPLOAD_SESSION_TTL + 60)
+    assert resumable.sweep_abandoned_uploads(now=later) == 1
+    remaining = [u["UploadId"] for u in s3.list_multipart_uploads(Bucket=storage.BUCKET).get("Uploads", [])]
+    assert remaining == [live]
+
+
+def test_late_retry_after_finalize_returns_the_file(s3):
+    s3_upload_id = s3.create_multipart_upload(Bucket=storage.BUCKET, Key="1/done.bin")["UploadId"]
+    upload = {"user_id": "1", "filename": "done.bin", "size": "10", "chunk_size": "10", "key": "1/done.bin", "s3_upload_id": s3_upload_id}
+    resumable.redis.hsetm(resumable.session_key("u"), upload)
+    resumable.redis.hset(resumable.parts_key("u"), "1", "etag")
+    resumable.complete_session("u", upload, 42)
+
+    user = SimpleNamespace(id=1)
+    response = asyncio.run(resumable.upload_chunk("u", None, 0, user))
+    assert response.status_code == 201
+    assert response.headers["Location"] == "/api/file/42"
+    assert response.headers["Upload-Offset"] == "10"
+    assert not resumable.redis.exists(resumable.parts_key("u"))
+    assert not resumable.redis.exists(resumable.s3_upload_key(s3_upload_id))
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(resumable.abort_upload("u", user))
+    assert e.value.status_code == 409
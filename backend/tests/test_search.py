@@ -0,0 +1,23 @@
+from sqlalchemy.dialects import mysql
+
+from db import Files
+from file.get import file_list_query, fulltext_terms
+
+
+def test_fulltext_operators_split_words():
+    assert fulltext_terms("2024-report") == "+2024* +report*"
+    assert fulltext_terms('"q3 (final)" @draft') == "+q3* +final* +draft*"
+
+
+def test_fulltext_only_operators_is_empty():
+    assert fulltext_terms("+-*~ ") == ""
+
+
+def test_prefix_page_is_limited_in_each_union_branch():
+    query = file_list_query(1, Files.filename.like("r%"), order_by=(Files.filename, Files.id), limit=51)
+    sql = str(query.compile(dialect=mysql.dialect(), compile_kwargs={"literal_binds": True}))
+    branches = sql.split("UNION ALL")
+    assert len(branches) == 2
+    for branch in branches:
+        assert "ORDER BY files.filename, files.id" in branch
+        assert "LIMIT 51" in branch
@@ -0,0 +1,26 @@
+import orjson
+from fastapi.responses import StreamingResponse
+
+from serialize import content_disposition, csv_chunks, json_array_chunks, stream_export
+
+
+def test_json_array_chunks_round_trip():
+    rows = [{"id": i, "filename": f"f{i}"} for i in range(1203)]
+    assert orjson.loads(b"".join(json_array_chunks(rows))) == rows
+    assert orjson.loads(b"".join(json_array_chunks([]))) == []
+
+
+def test_csv_chunks_header_from_first_row():
+    assert b"".join(csv_chunks([{"a": 1, "b": "x,y"}])) == b'a,b\r\n1,"x,y"\r\n'
+
+
+def test_content_disposition_encodes_unicode_and_quotes():
+    assert content_disposition("report.csv") == 'attachment; filename="report.csv"'
+    assert content_disposition("报告.txt") == "attachment; filename*=utf-8''%E6%8A%A5%E5%91%8A.txt"
+    assert content_disposition('a"b.txt') == "attachment; filename*=utf-8''a%22b.txt"
+
+
+def test_stream_export_accepts_non_latin1_names():
+    response = stream_export(iter([]), "csv", "用户-files")
+    assert isinstance(response, StreamingResponse)
+    assert response.headers["content-disposition"].startswith("attachment; filename*=utf-8''")
@@ -0,0 +1,115 @@
+import boto3
+import fakeredis
+import pytest
+from moto import mock_aws
+
+import storage
+from storage import tiering
+
+
+@pytest.fixture
+def s3():
+    with mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=storage.BUCKET)
+        yield client
+
+
+@pytest.fixture
+def tiers(monkeypatch):
+    """Record set_tier calls instead of writing to MariaDB."""
+    recorded = {}
+    monkeypatch.setattr(tiering, "set_tier", lambda file_id, tier: recorded.__setitem__(file_id, tier))
+    return recorded
+
+
+def test_archive_restore_round_trip(s3, tiers):
+    data = b"timestamp,level,message\n" * 50000
+    key = storage.object_key(1, "log.csv")
+    s3.put_object(Bucket=storage.BUCKET, Key=key, Body=data, ContentEncoding="zstd")
+
+    storage.move_object(s3, 7, 1, "log.csv", storage.ARCHIVE_TIER)
+    assert tiers[7] == storage.ARCHIVE_TIER
+    with pytest.raises(s3.exceptions.NoSuchKey):
+        s3.get_object(Bucket=storage.BUCKET, Key=key)
+
+    storage.restore_object(s3, 7, 1, "log.csv", storage.ARCHIVE_TIER)
+    assert tiers[7] == storage.HOT_TIER
+    restored = s3.get_object(Bucket=storage.BUCKET, Key=key)
+    assert restored["Body"].read() == data
+    assert restored["ContentEncoding"] == "zstd"
+    listed = s3.list_objects_v2(Bucket=storage.BUCKET, Prefix=storage.ARCHIVE_PREFIX)
+    assert listed["KeyCount"] == 0
+
+
+def test_restore_after_concurrent_restore(s3, tiers):
+    s3.put_object(Bucket=storage.BUCKET, Key=storage.object_key(1, "a.txt"), Body=b"hello")
+    storage.archive_object(s3, 1, "a.txt")
+    storage.restore_object(s3, 3, 1, "a.txt", storage.ARCHIVE_TIER)
+    tiers.clear()
+
+    # The second request still saw tier "archive" but the archive key is already gone
+    storage.restore_object(s3, 3, 1, "a.txt", storage.ARCHIVE_TIER)
+    assert tiers[3] == storage.HOT_TIER
+
+
+def test_flush_keeps_counters_when_update_fails(monkeypatch):
+    monkeypatch.setattr(tiering.redis, "client", fakeredis.FakeStrictRedis(decode_responses=True))
+
+    class FailingTransaction:
+        def __enter__(self):
+            raise RuntimeError("database down")
+
+        def __exit__(self, *exc):
+            return False
+
+    storage.record_access(5)
+    storage.record_access(5)
+    monkeypatch.setattr(tiering.db, "transaction", FailingTransaction)
+    with pytest.raises(RuntimeError):
+        storage.flush_access_counters()
+    storage.record_access(5)
+
+    executed = []
+
+    class RecordingTransaction:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def execute(self, stmt, params):
+            executed.append(params)
+
+    monkeypatch.setattr(tiering.db, "transaction", RecordingTransaction)
+    assert storage.flush_access_counters() == 1
+    assert executed[0][0]["hits"] == 2  # the batch that failed
+    assert storage.flush_access_counters() == 1
+    assert executed[1][0]["hits"] == 1  # recorded while the batch was pending
+    assert storage.flush_access_counters() == 0
+
+
+def test_archive_keeps_hot_object_when_tier_update_fails(s3, monkeypatch):
+    key = storage.object_key(1, "b.txt")
+    s3.put_object(Bucket=storage.BUCKET, Key=key, Body=b"hello")
+
+    def failing_set_tier(file_id, tier):
+        raise RuntimeError("database down")
+
+    monkeypatch.setattr(tiering, "set_tier", failing_set_tier)
+    with pytest.raises(RuntimeError):
+        storage.move_object(s3, 4, 1, "b.txt", storage.ARCHIVE_TIER)
+    assert s3.get_object(Bucket=storage.BUCKET, Key=key)["Body"].read() == b"hello"
+
+
+def test_recover_hot_object_falls_back_to_archive(s3, tiers):
+    key = storage.object_key(1, "c.txt")
+    s3.put_object(Bucket=storage.BUCKET, Key=key, Body=b"hello")
+    storage.move_object(s3, 6, 1, "c.txt", storage.ARCHIVE_TIER)
+
+    # The request read the row while it still said "hot"
+    assert storage.recover_hot_object(s3, 6, 1, "c.txt")
+    assert tiers[6] == storage.HOT_TIER
+    assert s3.get_object(Bucket=storage.BUCKET, Key=key)["Body"].read() == b"hello"
+    assert not storage.recover_hot_object(s3, 8, 1, "missing.txt")